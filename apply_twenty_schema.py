@@ -1,42 +1,183 @@
 import os
+import re
 import sys
-from typing import Any, Dict, List, Optional
-
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import yaml
 
 
 BASE_URL = os.environ.get("TWENTY_BASE_URL", "http://localhost:3000").rstrip("/")
 API_KEY = os.environ["TWENTY_API_KEY"]
+# Set TWENTY_DEBUG=1 to echo every request body and response headers.
+DEBUG = bool(os.environ.get("TWENTY_DEBUG"))
 
 S = requests.Session()
 S.headers.update(
     {
         "Authorization": f"Bearer {API_KEY}",
         "Content-Type": "application/json",
+        "Connection": "keep-alive",
     }
 )
+# Retries on rate limiting / transient gateway errors before giving up.
+MAX_RETRIES = 5
+# A gateway 502/504 or a dropped read on a POST/DELETE may come after the write
+# already landed, so urllib3 only retries GET/PATCH; send() retries these
+# methods itself, and only when the server refused the request.
+NON_IDEMPOTENT_METHODS = frozenset(["POST", "DELETE"])
+NON_IDEMPOTENT_RETRY_STATUSES = frozenset([429, 503])
+
+_adapter = HTTPAdapter(
+    pool_connections=64,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=MAX_RETRIES,
+        backoff_factor=0.2,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "PATCH"]),
+        # Hand the last response back so http() reports it as usual.
+        raise_on_status=False,
+    ),
+)
+S.mount("http://", _adapter)
+S.mount("https://", _adapter)
 
+# Parallel field-creation POSTs per object (kept below the pool size).
+FIELD_WORKERS = 16
 
-def http(method: str, path: str, **kwargs) -> Any:
+# Metadata listings are kept here between runs and revalidated with ETags.
+CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "twenty_migration",
+    "metadata.json",
+)
+
+# Optional create-field keys sent to the instance. Set e.g.
+# TWENTY_FIELD_CAPS=description,isNullable if yours rejects icon/settings/options.
+OPTIONAL_FIELD_KEYS = "description,icon,isNullable,defaultValue,settings,options"
+FIELD_CAPS = frozenset(
+    k.strip()
+    for k in os.environ.get("TWENTY_FIELD_CAPS", OPTIONAL_FIELD_KEYS).split(",")
+    if k.strip()
+)
+
+
+def retry_after_seconds(value: Optional[str], attempt: int) -> float:
+    # Retry-After is either delta-seconds or an HTTP-date; fall back to
+    # exponential backoff when missing or unparseable.
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+            return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    return 0.5 * (2 ** attempt)
+
+
+def send(method: str, url: str, **kwargs) -> requests.Response:
+    for attempt in range(MAX_RETRIES + 1):
+        r = S.request(method, url, timeout=60, **kwargs)
+        if (
+            method in NON_IDEMPOTENT_METHODS
+            and r.status_code in NON_IDEMPOTENT_RETRY_STATUSES
+            and attempt < MAX_RETRIES
+        ):
+            time.sleep(retry_after_seconds(r.headers.get("Retry-After"), attempt))
+            continue
+        break
+    return r
+
+
+def request(method: str, path: str, **kwargs) -> requests.Response:
     url = f"{BASE_URL}{path}"
-    print(f"  DEBUG: {method} {url}")
+    if DEBUG:
+        print(f"  DEBUG: {method} {url}")
+        if "json" in kwargs:
+            body = orjson.dumps(kwargs["json"], option=orjson.OPT_INDENT_2).decode()
+            print(f"  DEBUG: Body = {body}")
     if "json" in kwargs:
-        import json
-        print(f"  DEBUG: Body = {json.dumps(kwargs['json'], indent=2)}")
-    r = S.request(method, url, timeout=60, **kwargs)
+        kwargs["data"] = orjson.dumps(kwargs.pop("json"))
+    r = send(method, url, **kwargs)
     if r.status_code >= 400:
-        print(f"  DEBUG: Response = {r.text}")
-        print(f"  DEBUG: Status Code = {r.status_code}")
-        print(f"  DEBUG: Headers = {dict(r.headers)}")
+        # The RuntimeError below already carries the status and body.
+        if DEBUG:
+            print(f"  DEBUG: Headers = {dict(r.headers)}")
         raise RuntimeError(f"{method} {path} -> {r.status_code}\n{r.text}")
-    if r.text.strip():
-        return r.json()
+    return r
+
+
+def http(method: str, path: str, **kwargs) -> Any:
+    r = request(method, path, **kwargs)
+    if r.content.strip():
+        return orjson.loads(r.content)
     return None
 
 
+# ---------- Persistent metadata cache ----------
+
+_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def metadata_cache() -> Dict[str, Any]:
+    # {BASE_URL: {"objects": {"etag": ..., "data": ...}, "fields": {...}}}
+    try:
+        with open(CACHE_PATH, "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return {}
+
+
+def save_metadata_cache() -> None:
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    tmp = f"{CACHE_PATH}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps(metadata_cache()))
+    os.replace(tmp, CACHE_PATH)
+
+
+def cached_get(key: str, path: str) -> Any:
+    """GET a metadata listing, reusing the cached copy on 304 Not Modified"""
+    entry = metadata_cache().get(BASE_URL, {}).get(key)
+    headers = {"If-None-Match": entry["etag"]} if entry else {}
+    r = request("GET", path, headers=headers)
+    if r.status_code == 304 and entry:
+        return entry["data"]
+
+    res = orjson.loads(r.content)
+    etag = r.headers.get("ETag")
+    if etag:
+        with _cache_lock:
+            metadata_cache().setdefault(BASE_URL, {})[key] = {"etag": etag, "data": res}
+            save_metadata_cache()
+    return res
+
+
+def invalidate_cached(*keys: str) -> None:
+    with _cache_lock:
+        entries = metadata_cache().get(BASE_URL, {})
+        dropped = [k for k in keys if entries.pop(k, None) is not None]
+        if dropped:
+            save_metadata_cache()
+
+
 def list_objects() -> List[Dict[str, Any]]:
-    res = http("GET", "/rest/metadata/objects")
+    res = cached_get("objects", "/rest/metadata/objects")
     data = res.get("data", res)
     if isinstance(data, dict) and "objects" in data:
         return data["objects"]
@@ -45,14 +186,30 @@ def list_objects() -> List[Dict[str, Any]]:
     raise RuntimeError(f"Unexpected objects payload: {res}")
 
 
+@lru_cache(maxsize=None)
+def objects_by_singular() -> Dict[str, Dict[str, Any]]:
+    # Fetched once per process; create_object() keeps it up to date.
+    return {o.get("nameSingular"): o for o in list_objects()}
+
+
 def find_object_by_singular(name_singular: str) -> Optional[Dict[str, Any]]:
-    for o in list_objects():
-        if o.get("nameSingular") == name_singular:
-            return o
+    return objects_by_singular().get(name_singular)
+
+
+def unwrap_created(res: Any) -> Optional[Dict[str, Any]]:
+    # Accepts {"data": {...}}, {"data": {"createOneX": {...}}} or a bare entity.
+    data = res.get("data", res) if isinstance(res, dict) else None
+    if not isinstance(data, dict):
+        return None
+    if "id" in data:
+        return data
+    for v in data.values():
+        if isinstance(v, dict) and "id" in v:
+            return v
     return None
 
 
-def create_object(obj: Dict[str, Any]) -> Dict[str, Any]:
+def create_object(obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     payload = {
         "nameSingular": obj["nameSingular"],
         "namePlural": obj["namePlural"],
@@ -63,7 +220,19 @@ def create_object(obj: Dict[str, Any]) -> Dict[str, Any]:
         #"labelIdentifierFieldMetadataId": obj.get("labelIdentifierFieldMetadataId"),
         #"imageIdentifierFieldMetadataId": obj.get("imageIdentifierFieldMetadataId"),
     }
-    return http("POST", "/rest/metadata/objects", json=payload)
+    res = http("POST", "/rest/metadata/objects", json=payload)
+    invalidate_cached("objects", "fields")
+    created = unwrap_created(res)
+    if created:
+        objects_by_singular()[created.get("nameSingular", obj["nameSingular"])] = created
+    else:
+        # Unknown response shape: refetch on next lookup.
+        objects_by_singular.cache_clear()
+    # New objects come with standard fields (name, createdAt, ...) that the
+    # cached field listing doesn't know about yet.
+    fields_by_object.cache_clear()
+    existing_field_keys.cache_clear()
+    return created
 
 """
 def list_fields(object_metadata_id: str) -> List[Dict[str, Any]]:
@@ -93,10 +262,10 @@ def list_fields(object_metadata_id: str) -> List[Dict[str, Any]]:
     )
 """
 
-def list_fields(object_metadata_id: str) -> List[Dict[str, Any]]:
+def list_all_fields() -> List[Dict[str, Any]]:
     # Your Twenty REST metadata endpoints don't accept query params.
     # So: fetch all fields and filter client-side.
-    res = http("GET", "/rest/metadata/fields")
+    res = cached_get("fields", "/rest/metadata/fields")
 
     data = res.get("data", res)
 
@@ -115,55 +284,48 @@ def list_fields(object_metadata_id: str) -> List[Dict[str, Any]]:
     else:
         raise RuntimeError(f"Unexpected fields payload shape: {res}")
 
-    return [f for f in fields if f.get("objectMetadataId") == object_metadata_id]
+    return fields
+
+
+@lru_cache(maxsize=None)
+def fields_by_object() -> Dict[str, List[Dict[str, Any]]]:
+    # One GET for every object's fields; remember_field() appends new ones.
+    buckets: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for f in list_all_fields():
+        buckets[f.get("objectMetadataId")].append(f)
+    return buckets
+
+
+def list_fields(object_metadata_id: str) -> List[Dict[str, Any]]:
+    return fields_by_object()[object_metadata_id]
+
+
+@lru_cache(maxsize=None)
+def existing_field_keys() -> Set[Tuple[str, str]]:
+    # (objectMetadataId, name) pairs for O(1) "does this field exist?" checks.
+    return {
+        (object_id, f.get("name"))
+        for object_id, fields in fields_by_object().items()
+        for f in fields
+    }
+
 
+def remember_field(object_metadata_id: str, field: Dict[str, Any]) -> None:
+    fields_by_object()[object_metadata_id].append(field)
+    existing_field_keys().add((object_metadata_id, field.get("name")))
+
+_SNAKE_RE = re.compile(r"_+([^_]*)")
+
+
+@lru_cache(maxsize=4096)
 def snake_to_camel(snake_str: str) -> str:
     """Convert snake_case to camelCase"""
-    components = snake_str.split('_')
-    return components[0] + ''.join(x.title() for x in components[1:])
+    # Same result as title-casing each '_'-separated part, in one pass.
+    return _SNAKE_RE.sub(lambda m: m.group(1).title(), snake_str)
 
-def create_field_graphql(object_metadata_id: str, f: Dict[str, Any]) -> Dict[str, Any]:
-    """Try creating field using GraphQL API which might give better error messages"""
-    field_name = f["name"]
-    if '_' in field_name:
-        field_name = snake_to_camel(field_name)
-    
-    # Check if field name might be reserved
-    reserved_names = ['id', 'createdAt', 'updatedAt', 'deletedAt', 'externalId']
-    if field_name in reserved_names:
-        print(f"  WARNING: '{field_name}' might be a reserved field name, trying with suffix...")
-        field_name = field_name + "Custom"
-    
-    mutation = """
-    mutation CreateField($input: CreateFieldInput!) {
-      createOneField(input: $input) {
-        id
-        name
-        label
-        type
-      }
-    }
-    """
-    
-    variables = {
-        "input": {
-            "field": {
-                "type": f["type"],
-                "objectMetadataId": object_metadata_id,
-                "name": field_name,
-                "label": f.get("label", f["name"]),
-                "description": f.get("description", ""),
-            }
-        }
-    }
-    
-    payload = {
-        "query": mutation,
-        "variables": variables
-    }
-    
-    print(f"  DEBUG: GraphQL Payload = {payload}")
-    return http("POST", "/graphql", json=payload)
+def prune_empty(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop keys whose value is None, "", {} or []"""
+    return {k: v for k, v in payload.items() if v not in (None, "", {}, [])}
 
 
 def create_field(object_metadata_id: str, f: Dict[str, Any]) -> Dict[str, Any]:
@@ -178,79 +340,38 @@ def create_field(object_metadata_id: str, f: Dict[str, Any]) -> Dict[str, Any]:
         print(f"  WARNING: '{field_name}' might be a reserved field name, trying with suffix...")
         field_name = field_name + "Custom"
     
-    # Build minimal payload - start with just required fields
-    payload = {
-        "type": f["type"],
-        "objectMetadataId": object_metadata_id,
-        "name": field_name,
-        "label": f.get("label", f["name"]),
-    }
-    
-    # Add optional fields only if they have meaningful values
-    if f.get("description"):
-        payload["description"] = f["description"]
-    
-    # Only include icon if provided and non-empty
-    if f.get("icon"):
-        payload["icon"] = f["icon"]
-    
     # For isNullable, if it's False and no defaultValue, we might need to make it nullable
     # Twenty might require nullable=true for custom fields or require a defaultValue
     is_nullable = f.get("isNullable", True)
-    has_default = "defaultValue" in f and f["defaultValue"] is not None
+    has_default = f.get("defaultValue") is not None
     
     if not is_nullable and not has_default:
         # If field is not nullable and has no default, force it to be nullable
         print(f"  WARNING: Field '{field_name}' is not nullable but has no default value. Making it nullable.")
-        payload["isNullable"] = True
-    elif "isNullable" in f:
-        payload["isNullable"] = is_nullable
-    
-    # Only include defaultValue if explicitly provided and not None
-    if has_default:
-        payload["defaultValue"] = f["defaultValue"]
+        is_nullable = True
     
-    # Only include settings if provided and non-empty (not empty dict)
-    if f.get("settings") and f["settings"]:
-        payload["settings"] = f["settings"]
-    
-    # Only include options if provided and non-empty (not empty list)
-    if f.get("options") and f["options"]:
-        payload["options"] = f["options"]
+    optional = {
+        "description": f.get("description"),
+        "icon": f.get("icon"),
+        "isNullable": is_nullable if "isNullable" in f else None,
+        "defaultValue": f.get("defaultValue"),
+        "settings": f.get("settings"),
+        "options": f.get("options"),
+    }
+    payload = {
+        "type": f["type"],
+        "objectMetadataId": object_metadata_id,
+        "name": field_name,
+        "label": f.get("label", f["name"]),
+        **{k: v for k, v in prune_empty(optional).items() if k in FIELD_CAPS},
+    }
     
-    print(f"  DEBUG: Payload = {payload}")
+    if DEBUG:
+        print(f"  DEBUG: Payload = {payload}")
     
-    # Try with the payload
-    try:
-        return http("POST", "/rest/metadata/fields", json=payload)
-    except RuntimeError as e:
-        error_msg = str(e)
-        print(f"  DEBUG: REST API failed, trying GraphQL...")
-        
-        # Try GraphQL API instead
-        try:
-            return create_field_graphql(object_metadata_id, f)
-        except RuntimeError as graphql_error:
-            print(f"  DEBUG: GraphQL also failed: {graphql_error}")
-            
-            # If GraphQL also fails, try without icon
-            if "icon" in payload:
-                print(f"  DEBUG: Retrying REST without icon...")
-                payload_no_icon = {k: v for k, v in payload.items() if k != "icon"}
-                try:
-                    return http("POST", "/rest/metadata/fields", json=payload_no_icon)
-                except RuntimeError:
-                    pass
-            
-            # If still fails, try absolute minimal payload
-            print(f"  DEBUG: Retrying with absolute minimal payload...")
-            minimal_payload = {
-                "type": f["type"],
-                "objectMetadataId": object_metadata_id,
-                "name": field_name,
-                "label": f.get("label", f["name"]),
-            }
-            return http("POST", "/rest/metadata/fields", json=minimal_payload)
+    res = http("POST", "/rest/metadata/fields", json=payload)
+    invalidate_cached("fields")
+    return res
 
 
 def apply_schema(schema: Dict[str, Any]) -> None:
@@ -264,8 +385,9 @@ def apply_schema(schema: Dict[str, Any]) -> None:
 
         if not existing:
             print(f"[object] creating {name_singular}")
-            create_object(obj)
-            existing = find_object_by_singular(name_singular)
+            # Use the created object directly; only look it up again if the
+            # response didn't include it.
+            existing = create_object(obj) or find_object_by_singular(name_singular)
             if not existing:
                 raise RuntimeError(f"Object {name_singular} not found after create")
         else:
@@ -274,21 +396,33 @@ def apply_schema(schema: Dict[str, Any]) -> None:
         object_id = existing["id"]
 
         # Ensure fields
-        current_fields = list_fields(object_id)
-        current_names = {f.get("name") for f in current_fields}
-        print(f"  DEBUG: Existing fields: {sorted(current_names)}")
+        field_keys = existing_field_keys()
+        if DEBUG:
+            current_names = {f.get("name") for f in list_fields(object_id)}
+            print(f"  DEBUG: Existing fields: {sorted(current_names)}")
 
+        to_create = []
         for f in obj.get("fields", []):
             fname = f["name"]
             # Convert to camelCase for comparison
             fname_camel = snake_to_camel(fname) if '_' in fname else fname
             
             # Check both snake_case and camelCase versions
-            if fname in current_names or fname_camel in current_names:
+            if (object_id, fname) in field_keys or (object_id, fname_camel) in field_keys:
                 print(f"  [field] exists {fname} (as {fname_camel})")
                 continue
-            print(f"  [field] creating {fname} ({f['type']})")
-            create_field(object_id, f)
+            to_create.append(f)
+
+        def create_one(f: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            created = unwrap_created(create_field(object_id, f))
+            print(f"  [field] created {f['name']} ({f['type']})")
+            return created
+
+        # Field POSTs are independent; the shared session is thread-safe.
+        with ThreadPoolExecutor(max_workers=FIELD_WORKERS) as ex:
+            for created in ex.map(create_one, to_create):
+                if created:
+                    remember_field(object_id, created)
 
         # Optional: you might want to set labelIdentifierFieldMetadataId after creating fields
         # That requires an update endpoint for objects (not shown here), so we only create.
@@ -1,8 +1,13 @@
 import os
 import sys
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from typing import Any, Dict, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 BASE_URL = os.environ.get("TWENTY_BASE_URL", "http://localhost:3000").rstrip("/")
@@ -13,13 +18,66 @@ S.headers.update(
     {
         "Authorization": f"Bearer {API_KEY}",
         "Content-Type": "application/json",
+        "Connection": "keep-alive",
     }
 )
+# Retries on rate limiting / transient gateway errors before giving up.
+MAX_RETRIES = 5
+# A gateway 502/504 or a dropped read on a POST/DELETE may come after the write
+# already landed, so urllib3 only retries GET/PATCH; send() retries these
+# methods itself, and only when the server refused the request.
+NON_IDEMPOTENT_METHODS = frozenset(["POST", "DELETE"])
+NON_IDEMPOTENT_RETRY_STATUSES = frozenset([429, 503])
+
+_adapter = HTTPAdapter(
+    pool_connections=64,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=MAX_RETRIES,
+        backoff_factor=0.2,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "PATCH"]),
+        # Hand the last response back so http() reports it as usual.
+        raise_on_status=False,
+    ),
+)
+S.mount("http://", _adapter)
+S.mount("https://", _adapter)
+
+
+def retry_after_seconds(value: Optional[str], attempt: int) -> float:
+    # Retry-After is either delta-seconds or an HTTP-date; fall back to
+    # exponential backoff when missing or unparseable.
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+            return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    return 0.5 * (2 ** attempt)
+
+
+def send(method: str, url: str, **kwargs) -> requests.Response:
+    for attempt in range(MAX_RETRIES + 1):
+        r = S.request(method, url, timeout=60, **kwargs)
+        if (
+            method in NON_IDEMPOTENT_METHODS
+            and r.status_code in NON_IDEMPOTENT_RETRY_STATUSES
+            and attempt < MAX_RETRIES
+        ):
+            time.sleep(retry_after_seconds(r.headers.get("Retry-After"), attempt))
+            continue
+        break
+    return r
 
 
 def http(method: str, path: str, **kwargs) -> Any:
     url = f"{BASE_URL}{path}"
-    r = S.request(method, url, timeout=60, **kwargs)
+    r = send(method, url, **kwargs)
     if r.status_code >= 400:
         raise RuntimeError(f"{method} {path} -> {r.status_code}\n{r.text}")
     if r.text.strip():
@@ -1,11 +1,16 @@
+import asyncio
 import os
 import re
 import sys
-import time
-from typing import Any, Dict, List, Optional
-
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Awaitable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import httpx
+import orjson
 import pandas as pd
-import requests
 
 
 BASE_URL = os.environ.get("TWENTY_BASE_URL", "http://localhost:3000/")
@@ -15,19 +20,48 @@ if not API_KEY:
     print("Please set it with: export TWENTY_API_KEY='your-api-key'")
     sys.exit(1)
 
-S = requests.Session()
-S.headers.update(
-    {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json",
-    }
-)
-
-
+HEADERS = {
+    "Authorization": f"Bearer {API_KEY}",
+    "Content-Type": "application/json",
+}
+
+# Max in-flight record upserts; also caps open connections to the host.
+CONCURRENCY = 64
+# Retries on rate limiting / transient gateway errors before giving up.
+MAX_RETRIES = 5
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+# A gateway 502/504 on a POST/DELETE may come after the write already landed;
+# retrying would duplicate records, so these only retry when the server
+# refused the request.
+NON_IDEMPOTENT_METHODS = frozenset(["POST", "DELETE"])
+NON_IDEMPOTENT_RETRY_STATUSES = frozenset([429, 503])
+# Rows per bulk create request.
+BATCH_SIZE = 100
+# Records per page when indexing existing records.
+PAGE_SIZE = 1000
+# Rows sampled for field type inference, and rows read per CSV chunk.
+INFER_ROWS = 10_000
+CHUNK_SIZE = 1000
+# Id-like columns are created as TEXT fields and read verbatim, so numeric
+# ids aren't float-promoted and leading zeros ("001") survive.
+ID_COLUMNS = frozenset(["external_id", "id", "uuid"])
+
+
+class HTTPError(RuntimeError):
+    def __init__(self, method: str, path: str, status: int, text: str) -> None:
+        super().__init__(f"{method} {path} -> {status}\n{text}")
+        self.status = status
+
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_MULTI_UNDER = re.compile(r"_+")
+
+
+@lru_cache(maxsize=1024)
 def slugify(s: str) -> str:
     s = s.strip().lower()
-    s = re.sub(r"[^a-z0-9]+", "_", s)
-    s = re.sub(r"_+", "_", s).strip("_")
+    s = _NON_ALNUM.sub("_", s)
+    s = _MULTI_UNDER.sub("_", s).strip("_")
     if not s:
         raise ValueError("Cannot slugify empty string")
     if s[0].isdigit():
@@ -35,21 +69,49 @@ def slugify(s: str) -> str:
     return s
 
 
-def http(method: str, path: str, **kwargs) -> Any:
+def retry_after_seconds(value: Optional[str], attempt: int) -> float:
+    # Retry-After is either delta-seconds or an HTTP-date; fall back to
+    # exponential backoff when missing or unparseable.
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+            return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    return 0.5 * (2 ** attempt)
+
+
+async def http(client: httpx.AsyncClient, method: str, path: str, **kwargs) -> Any:
     url = f"{BASE_URL}{path}"
-    r = S.request(method, url, timeout=60, **kwargs)
-    if r.status_code >= 400:
-        raise RuntimeError(f"{method} {path} -> {r.status_code}\n{r.text}")
-    if r.text.strip():
-        return r.json()
-    return None
+    if "json" in kwargs:
+        # orjson is much faster than the stdlib encoder on large bulk payloads.
+        kwargs["content"] = orjson.dumps(kwargs.pop("json"), option=orjson.OPT_SERIALIZE_NUMPY)
+    if method in NON_IDEMPOTENT_METHODS:
+        retry_statuses = NON_IDEMPOTENT_RETRY_STATUSES
+    else:
+        retry_statuses = RETRY_STATUSES
+    for attempt in range(MAX_RETRIES + 1):
+        r = await client.request(method, url, **kwargs)
+        if r.status_code in retry_statuses and attempt < MAX_RETRIES:
+            delay = retry_after_seconds(r.headers.get("Retry-After"), attempt)
+            await asyncio.sleep(delay)
+            continue
+        if r.status_code >= 400:
+            raise HTTPError(method, path, r.status_code, r.text)
+        if r.content.strip():
+            return orjson.loads(r.content)
+        return None
 
 
 # ---------- Metadata: objects ----------
 
 
-def get_objects() -> List[Dict[str, Any]]:
-    res = http("GET", "/rest/metadata/objects")
+async def get_objects(client: httpx.AsyncClient) -> List[Dict[str, Any]]:
+    res = await http(client, "GET", "/rest/metadata/objects")
     data = res.get("data", res)
 
     # supports both:
@@ -62,14 +124,18 @@ def get_objects() -> List[Dict[str, Any]]:
     raise RuntimeError(f"Unexpected objects payload shape: {res}")
 
 
-def find_object(name_singular: str) -> Optional[Dict[str, Any]]:
-    for obj in get_objects():
+async def find_object(
+    client: httpx.AsyncClient,
+    name_singular: str,
+) -> Optional[Dict[str, Any]]:
+    for obj in await get_objects(client):
         if obj.get("nameSingular") == name_singular:
             return obj
     return None
 
 
-def create_object(
+async def create_object(
+    client: httpx.AsyncClient,
     name_singular: str,
     name_plural: str,
     label_singular: str,
@@ -87,15 +153,19 @@ def create_object(
         "labelIdentifierFieldMetadataId": None,
         "imageIdentifierFieldMetadataId": None,
     }
-    return http("POST", "/rest/metadata/objects", json=payload)
+    return await http(client, "POST", "/rest/metadata/objects", json=payload)
 
 
 # ---------- Metadata: fields ----------
 
 
-def get_fields_for_object(object_metadata_id: str) -> List[Dict[str, Any]]:
+async def get_fields_for_object(
+    client: httpx.AsyncClient,
+    object_metadata_id: str,
+) -> List[Dict[str, Any]]:
     # This is the only part that might need adjustment if the endpoint differs.
-    res = http(
+    res = await http(
+        client,
         "GET",
         "/rest/metadata/fields",
         params={"objectMetadataId": object_metadata_id},
@@ -114,7 +184,8 @@ def get_fields_for_object(object_metadata_id: str) -> List[Dict[str, Any]]:
     raise RuntimeError(f"Unexpected fields payload shape: {res}")
 
 
-def create_field(
+async def create_field(
+    client: httpx.AsyncClient,
     object_metadata_id: str,
     name: str,
     label: str,
@@ -137,7 +208,7 @@ def create_field(
         "settings": settings or {},
         "options": options or [],
     }
-    return http("POST", "/rest/metadata/fields", json=payload)
+    return await http(client, "POST", "/rest/metadata/fields", json=payload)
 
 
 def infer_twenty_type(series: pd.Series) -> str:
@@ -146,55 +217,44 @@ def infer_twenty_type(series: pd.Series) -> str:
     if s.empty:
         return "TEXT"
 
+    # ids
+    if series.name and series.name.lower() in ID_COLUMNS:
+        return "TEXT"
+
+    # Typed columns: pandas already knows the answer.
+    if pd.api.types.is_bool_dtype(s):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(s):
+        return "BOOLEAN" if s.isin([0, 1]).all() else "NUMBER"
+    if pd.api.types.is_float_dtype(s):
+        return "NUMBER"
+
     # try boolean
     as_str = s.astype(str).str.lower()
     if as_str.isin(["true", "false", "0", "1", "yes", "no"]).all():
         return "BOOLEAN"
 
     # try number
-    def is_intlike(x: Any) -> bool:
-        try:
-            f = float(x)
-            return f.is_integer()
-        except Exception:
-            return False
-
-    def is_floatlike(x: Any) -> bool:
-        try:
-            float(x)
-            return True
-        except Exception:
-            return False
-
-    if s.map(is_intlike).all():
-        return "NUMBER"
-    if s.map(is_floatlike).all():
+    if pd.to_numeric(s, errors="coerce").notna().all():
         return "NUMBER"
 
-    # ids
-    if series.name and series.name.lower() in ["external_id", "id", "uuid"]:
-        return "TEXT"
-
     # default
     return "TEXT"
 
 
-def ensure_fields(
+async def ensure_fields(
+    client: httpx.AsyncClient,
     object_metadata_id: str,
-    csv_columns: List[str],
+    slug_map: Dict[str, str],
     df: pd.DataFrame,
 ) -> None:
-    existing = get_fields_for_object(object_metadata_id)
+    existing = await get_fields_for_object(client, object_metadata_id)
     existing_names = {f.get("name") for f in existing}
 
-    for col in csv_columns:
-        field_name = slugify(col)
-        if field_name in existing_names:
-            continue
-
+    async def create_one(col: str, field_name: str) -> None:
         field_type = infer_twenty_type(df[col])
-        print(f"Creating field {field_name} ({field_type})")
-        create_field(
+        await create_field(
+            client,
             object_metadata_id=object_metadata_id,
             name=field_name,
             label=col,
@@ -202,22 +262,28 @@ def ensure_fields(
             description=f"Imported from CSV column '{col}'",
             is_nullable=True,
         )
+        print(f"Created field {field_name} ({field_type})")
+
+    # Field POSTs are independent, so issue them concurrently.
+    missing = [(col, name) for col, name in slug_map.items() if name not in existing_names]
+    await asyncio.gather(*(create_one(col, name) for col, name in missing))
 
 
 # ---------- Data (records) ----------
 
 
-def list_records(
-    name_plural: str,
-    external_id_field: str,
-    external_id_value: str,
-) -> List[Dict[str, Any]]:
-    # Filtering syntax may differ; if this fails, we'll adapt to your API.
-    res = http(
-        "GET",
-        f"/rest/{name_plural}",
-        params={f"filter[{external_id_field}]": external_id_value, "limit": 1},
-    )
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+async def limited(sem: asyncio.Semaphore, aw: Awaitable[Any]) -> Any:
+    async with sem:
+        return await aw
+
+
+def parse_records(name_plural: str, res: Any) -> List[Dict[str, Any]]:
     data = res.get("data", res)
     if isinstance(data, dict) and "records" in data:
         return data["records"]
@@ -234,85 +300,230 @@ def list_records(
     return []
 
 
-def create_record(name_plural: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-    return http("POST", f"/rest/{name_plural}", json=payload)
+def parse_created(res: Any) -> List[Dict[str, Any]]:
+    # {"data": {"createPerson": {...}}} or {"data": {"createPeople": [...]}}
+    data = res.get("data", res) if isinstance(res, dict) else res
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        if "id" in data:
+            return [data]
+        for v in data.values():
+            if isinstance(v, list):
+                return v
+            if isinstance(v, dict) and "id" in v:
+                return [v]
+    return []
+
+
+async def index_records_by_external_id(
+    client: httpx.AsyncClient,
+    name_plural: str,
+    external_id_field: str,
+) -> Dict[str, str]:
+    # Page through every record once instead of filtering per row.
+    index: Dict[str, str] = {}
+    params: Dict[str, Any] = {"limit": PAGE_SIZE}
+    while True:
+        res = await http(client, "GET", f"/rest/{name_plural}", params=params)
+        for rec in parse_records(name_plural, res):
+            ext = rec.get(external_id_field)
+            if ext is not None and rec.get("id"):
+                index[str(ext)] = rec["id"]
+
+        page_info = res.get("pageInfo") or (res.get("data") or {}).get("pageInfo") or {}
+        cursor = page_info.get("endCursor")
+        if not page_info.get("hasNextPage") or not cursor:
+            return index
+        params["starting_after"] = cursor
+
+
+async def create_record(
+    client: httpx.AsyncClient,
+    name_plural: str,
+    payload: Dict[str, Any],
+) -> Dict[str, Any]:
+    return await http(client, "POST", f"/rest/{name_plural}", json=payload)
+
+
+async def bulk_create_records(
+    client: httpx.AsyncClient,
+    name_plural: str,
+    rows: List[Dict[str, Any]],
+) -> Any:
+    # Twenty's batch endpoint takes a JSON array of records.
+    return await http(client, "POST", f"/rest/batch/{name_plural}", json=rows)
 
 
-def update_record(name_plural: str, record_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-    return http("PATCH", f"/rest/{name_plural}/{record_id}", json=payload)
+async def update_record(
+    client: httpx.AsyncClient,
+    name_plural: str,
+    record_id: str,
+    payload: Dict[str, Any],
+) -> Dict[str, Any]:
+    return await http(client, "PATCH", f"/rest/{name_plural}/{record_id}", json=payload)
 
 
-def upsert_record(
+async def create_records(
+    client: httpx.AsyncClient,
+    sem: asyncio.Semaphore,
     name_plural: str,
-    external_id_field: str,
-    row: Dict[str, Any],
-) -> None:
-    ext = str(row.get(external_id_field) or "").strip()
-    if not ext:
-        raise ValueError(f"Row missing {external_id_field}: {row}")
-
-    matches = list_records(name_plural, external_id_field, ext)
-    if matches:
-        rec = matches[0]
-        rec_id = rec.get("id")
-        if not rec_id:
-            raise RuntimeError(f"Cannot upsert: record has no id: {rec}")
-        update_record(name_plural, rec_id, row)
+    rows: List[Dict[str, Any]],
+    use_batch: Optional[bool],
+) -> Tuple[List[Dict[str, Any]], Optional[bool]]:
+    """Create rows; use_batch is None until the batch endpoint has been probed"""
+    batches = list(chunked(rows, BATCH_SIZE))
+    if not batches:
+        return [], use_batch
+
+    results: List[Any] = []
+    if use_batch is None:
+        # Probe the batch endpoint once with the first batch; fall back to one
+        # POST per row on instances that don't expose it.
+        try:
+            results.append(
+                await limited(sem, bulk_create_records(client, name_plural, batches[0]))
+            )
+            use_batch = True
+            batches = batches[1:]
+        except HTTPError as e:
+            if e.status != 404:
+                raise
+            print("Batch endpoint not available; creating records one by one")
+            use_batch = False
+
+    if use_batch:
+        results += await asyncio.gather(
+            *(limited(sem, bulk_create_records(client, name_plural, b)) for b in batches)
+        )
     else:
-        create_record(name_plural, row)
+        results += await asyncio.gather(
+            *(limited(sem, create_record(client, name_plural, row)) for row in rows)
+        )
+    return [rec for res in results for rec in parse_created(res)], use_batch
 
 
-# ---------- Main ----------
+async def upsert_records(
+    client: httpx.AsyncClient,
+    sem: asyncio.Semaphore,
+    name_plural: str,
+    external_id_field: str,
+    rows: List[Dict[str, Any]],
+    index: Dict[str, str],
+    use_batch: Optional[bool],
+) -> Optional[bool]:
+    by_ext: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        ext = str(row.get(external_id_field) or "").strip()
+        if not ext:
+            raise ValueError(f"Row missing {external_id_field}: {row}")
+        by_ext[ext] = row
+
+    to_create = [row for ext, row in by_ext.items() if ext not in index]
+    to_update = [(index[ext], row) for ext, row in by_ext.items() if ext in index]
+    print(f"Creating {len(to_create)} records, updating {len(to_update)}")
+
+    # Record new ids so later rows with the same external id become updates.
+    created, use_batch = await create_records(client, sem, name_plural, to_create, use_batch)
+    for rec in created:
+        ext = rec.get(external_id_field)
+        if ext is not None and rec.get("id"):
+            index[str(ext)] = rec["id"]
+    await asyncio.gather(
+        *(
+            limited(sem, update_record(client, name_plural, rec_id, row))
+            for rec_id, row in to_update
+        )
+    )
+    return use_batch
 
 
-def main() -> None:
-    if len(sys.argv) < 2:
-        print("Usage: python bootstrap_twenty_csv.py file.csv [singular] [plural]")
-        sys.exit(2)
+def chunk_records(chunk: pd.DataFrame, slug_map: Dict[str, str]) -> List[Dict[str, Any]]:
+    # Every row shares the same keys (slugified field names), so zip them
+    # onto the raw value rows rather than renaming and boxing per row.
+    cols = tuple(slug_map[c] for c in chunk.columns)
+    values = chunk.astype(object).where(pd.notna(chunk), None).to_numpy(dtype=object)
+    return [dict(zip(cols, row_vals)) for row_vals in values]
 
-    csv_path = sys.argv[1]
-    base = os.path.splitext(os.path.basename(csv_path))[0]
-    name_singular = slugify(sys.argv[2]) if len(sys.argv) >= 3 else slugify(base)
-    name_plural = slugify(sys.argv[3]) if len(sys.argv) >= 4 else slugify(f"{base}s")
 
-    df = pd.read_csv(csv_path)
+# ---------- Main ----------
 
-    if "external_id" not in df.columns:
+
+async def run(csv_path: str, name_singular: str, name_plural: str) -> None:
+    base = os.path.splitext(os.path.basename(csv_path))[0]
+    # Only a sample is held for inference; rows are streamed below.
+    columns = pd.read_csv(csv_path, nrows=0).columns
+    dtypes = {c: str for c in columns if c.lower() in ID_COLUMNS}
+    head = pd.read_csv(csv_path, nrows=INFER_ROWS, dtype=dtypes)
+
+    if "external_id" not in head.columns:
         raise ValueError("CSV must include column 'external_id' for idempotent upserts")
 
-    # Ensure object
-    obj = find_object(name_singular)
-    if not obj:
-        print(f"Creating object: {name_singular}/{name_plural}")
-        create_object(
-            name_singular=name_singular,
-            name_plural=name_plural,
-            label_singular=base.title(),
-            label_plural=f"{base.title()}s",
-            description=f"Bootstrapped from {os.path.basename(csv_path)}",
-        )
-        time.sleep(1.0)
-        obj = find_object(name_singular)
+    # CSV column -> field name, shared by field creation and row renaming.
+    slug_map = {c: slugify(c) for c in head.columns}
+
+    # HTTP/2 multiplexes the concurrent requests over a single connection.
+    limits = httpx.Limits(
+        max_connections=CONCURRENCY,
+        max_keepalive_connections=CONCURRENCY,
+        keepalive_expiry=60,
+    )
+    async with httpx.AsyncClient(
+        headers=HEADERS, http2=True, limits=limits, timeout=60
+    ) as client:
+        # Ensure object
+        obj = await find_object(client, name_singular)
         if not obj:
-            raise RuntimeError("Object creation did not appear in list after creation")
+            print(f"Creating object: {name_singular}/{name_plural}")
+            res = await create_object(
+                client,
+                name_singular=name_singular,
+                name_plural=name_plural,
+                label_singular=base.title(),
+                label_plural=f"{base.title()}s",
+                description=f"Bootstrapped from {os.path.basename(csv_path)}",
+            )
+            created = parse_created(res)
+            if created:
+                obj = created[0]
+            else:
+                await asyncio.sleep(1.0)
+                obj = await find_object(client, name_singular)
+            if not obj:
+                raise RuntimeError("Object creation did not appear in list after creation")
+
+        object_id = obj["id"]
+        print(f"Using object id={object_id}")
+
+        # Ensure fields
+        await ensure_fields(client, object_id, slug_map, head)
+
+        # Upsert data, one CSV chunk at a time
+        index = await index_records_by_external_id(client, name_plural, "external_id")
+        print(f"Indexed {len(index)} existing records")
+        # Whether /rest/batch exists; decided by the first chunk that creates rows.
+        use_batch: Optional[bool] = None
+        sem = asyncio.Semaphore(CONCURRENCY)
+        for chunk in pd.read_csv(csv_path, chunksize=CHUNK_SIZE, dtype=dtypes):
+            rows = chunk_records(chunk, slug_map)
+            use_batch = await upsert_records(
+                client, sem, name_plural, "external_id", rows, index, use_batch
+            )
 
-    object_id = obj["id"]
-    print(f"Using object id={object_id}")
+    print("Done.")
 
-    # Ensure fields
-    ensure_fields(object_id, list(df.columns), df)
 
-    # Normalize keys to slugified field names
-    rename_map = {c: slugify(c) for c in df.columns}
-    df = df.rename(columns=rename_map)
+def main() -> None:
+    if len(sys.argv) < 2:
+        print("Usage: python bootstrap_twenty_csv.py file.csv [singular] [plural]")
+        sys.exit(2)
 
-    # Upsert data
-    for _, r in df.iterrows():
-        row = {k: (None if pd.isna(v) else v) for k, v in r.to_dict().items()}
-        upsert_record(name_plural, "external_id", row)
-        time.sleep(0.02)
+    csv_path = sys.argv[1]
+    base = os.path.splitext(os.path.basename(csv_path))[0]
+    name_singular = slugify(sys.argv[2]) if len(sys.argv) >= 3 else slugify(base)
+    name_plural = slugify(sys.argv[3]) if len(sys.argv) >= 4 else slugify(f"{base}s")
 
-    print("Done.")
+    asyncio.run(run(csv_path, name_singular, name_plural))
 
 
 if __name__ == "__main__":